@@ -0,0 +1,70 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+# Optional C-compiled drop-in for app.parse_pm_line (same token rules:
+# [-+]?digits.digits -> float, [-+]?digits -> int, anything else -> None).
+# Build in place with:  cythonize -i _fastparse.pyx
+# app.py falls back to the pure-Python parser if this module is not built.
+from cpython.bytes cimport PyBytes_AS_STRING, PyBytes_GET_SIZE
+from libc.stdlib cimport strtod, strtoll
+
+cdef inline bint _is_space(char c):
+    return c == b' ' or c == b'\t' or c == b'\n' or c == b'\r' or c == b'\v' or c == b'\f'
+
+cdef inline bint _is_digit(char c):
+    return b'0' <= c <= b'9'
+
+def parse_pm_line(bytes raw):
+    cdef const char *buf = PyBytes_AS_STRING(raw)
+    cdef Py_ssize_t n = PyBytes_GET_SIZE(raw)
+    cdef Py_ssize_t i = 0, start, j, digits
+    cdef int kind  # 0 = invalid, 1 = float, 2 = int
+    cdef list values = []
+
+    if n < 2 or buf[0] != b'p' or buf[1] != b'm':
+        return None
+
+    # "pm" header token
+    while i < n and not _is_space(buf[i]):
+        i += 1
+
+    while True:
+        while i < n and _is_space(buf[i]):
+            i += 1
+        if i >= n:
+            break
+        start = i
+        while i < n and not _is_space(buf[i]):
+            i += 1
+
+        # Validate the token [start, i) before handing it to strtod/strtoll,
+        # which would otherwise also accept "1e3", "inf", hex, ...
+        j = start
+        if buf[j] == b'+' or buf[j] == b'-':
+            j += 1
+        digits = j
+        while j < i and _is_digit(buf[j]):
+            j += 1
+        if j == digits:
+            kind = 0
+        elif j == i:
+            kind = 2
+        elif buf[j] == b'.' and j + 1 < i:
+            j += 1
+            while j < i and _is_digit(buf[j]):
+                j += 1
+            kind = 1 if j == i else 0
+        else:
+            kind = 0
+
+        # Tokens end at whitespace or the bytes' trailing NUL, so the C
+        # converters stop exactly at i.
+        if kind == 1:
+            values.append(strtod(buf + start, NULL))
+        elif kind == 2:
+            if i - digits <= 18:
+                values.append(strtoll(buf + start, NULL, 10))
+            else:
+                values.append(int(raw[start:i]))  # beyond long long
+        else:
+            values.append(None)
+
+    return values or None
@@ -1,15 +1,23 @@
 __version__ = "1.1.1"
 
 import os
+import queue
+import random
 import signal
-import sys
+import socket
+import threading
 import time
 import json
-import telnetlib
+import re
 import logging
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import paho.mqtt.client as mqtt
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:  # optional, falls back to stdlib json
+    HAS_ORJSON = False
 from channel_map_with_aliases import channel_map
 
 # ------------------ Konfiguration (über ENV mit Defaults) ------------------
@@ -21,22 +29,40 @@ MQTT_USER    = os.getenv("MQTT_USER", "mqtt-user")
 MQTT_PASS    = os.getenv("MQTT_PASS", "password")
 MQTT_BASE    = os.getenv("MQTT_TOPIC_BASE", "nano_pk")
 MQTT_STATUS  = f"{MQTT_BASE}/status"
+HA_STATUS    = "homeassistant/status"  # HA birth/will topic (discovery prefix)
 CLIENT_ID    = os.getenv("MQTT_CLIENT_ID", "nano-pk-bridge")
 
-QOS          = int(os.getenv("MQTT_QOS", "1"))  # 0/1
-FLOAT_EPS    = float(os.getenv("FLOAT_EPS", "0.001"))
-
-# NEW: control MQTT retain via .env
-MQTT_RETAIN  = os.getenv("MQTT_RETAIN", "true").lower() in ("1", "true", "yes", "on")
+QOS          = int(os.getenv("MQTT_QOS", "1"))  # 0/1, used for status/LWT + discovery
+# Telemetry is re-sent on every change, so QoS 0 (no PUBACK wait) is enough;
+# set TELEMETRY_QOS=1 if single lost samples matter more than throughput.
+TELEMETRY_QOS = int(os.getenv("TELEMETRY_QOS", "0"))  # 0/1
+# Floats go out with a fixed number of decimals; dedup compares these bytes
+FLOAT_DECIMALS = int(os.getenv("FLOAT_DECIMALS", "2"))
+RECV_BUFSIZE = 1 << 16
+TX_DRAIN_MAX = 32  # max. queued pm lines the publisher folds into one batch
+
+# Retain for telemetry only (status/LWT and discovery are always retained).
+# Off by default: every retained write makes the broker overwrite stored state.
+# Unchanged values are still re-sent whenever they'd otherwise be missing:
+# after each MQTT (re)connect and on Home Assistant's birth message.
+MQTT_RETAIN  = os.getenv("MQTT_RETAIN", "false").lower() in ("1", "true", "yes", "on")
 
 # ------------------ Konstanten ------------------
-ZK_STATUS_MAP = {
+_ZK_STATUS_MAP_STR = {
     0: "Unbekannt", 1: "Aus", 2: "Startvorbereitung", 3: "Kessel Start",
     4: "Zündüberwachung", 5: "Zündung", 6: "Übergang LB", 7: "Leistungsbrand",
     8: "Gluterhaltung", 9: "Warten auf EA", 10: "Entaschung", 11: "-",
     12: "Putzen"
 }
 
+# Pre-encoded once, so paho gets bytes and skips str.encode() per publish
+ZK_STATUS_MAP = {k: v.encode("utf-8") for k, v in _ZK_STATUS_MAP_STR.items()}
+
+_FLOAT_FMT = b"%%.%df" % FLOAT_DECIMALS
+
+B_ONLINE  = b"online"
+B_OFFLINE = b"offline"
+
 # ------------------ Logging ------------------
 logging.basicConfig(
     level=logging.INFO,
@@ -45,62 +71,52 @@ logging.basicConfig(
 log = logging.getLogger("nano-pk")
 
 # ------------------ Helpers ------------------
-def get_device_class(name: str, unit: str) -> Optional[str]:
-    if unit == "°C":
-        return "temperature"
-    elif unit == "%":
-        return "humidity" if ("Feuchte" in name or "Luftfeuchte" in name) else None
-    elif unit == "bar":
-        return "pressure"
-    elif "Leistung" in name:
-        return "power"
-    return None
-
-def almost_equal(a: Any, b: Any) -> bool:
-    if isinstance(a, float) or isinstance(b, float):
-        try:
-            return abs(float(a) - float(b)) < FLOAT_EPS
-        except Exception:
-            return False
-    return a == b
+# float | int | anything else (-> None); a token only counts as number if it ends there
+_TOKEN_RE = re.compile(rb"([-+]?\d+\.\d+)(?!\S)|([-+]?\d+)(?!\S)|(\S+)")
 
-def parse_pm_line(line: str):
-    if not line or not line.startswith("pm"):
+def parse_pm_line(raw: bytes) -> Optional[List[Any]]:
+    if not raw.startswith(b"pm"):
         return None
-    parts = line.strip().split()
-    if len(parts) < 2:
-        return None
-    values = []
-    for v in parts[1:]:
-        try:
-            values.append(float(v) if "." in v else int(v))
-        except ValueError:
-            values.append(None)
-    return values
-
-# ------------------ MQTT ------------------
-def mqtt_connect() -> Optional[mqtt.Client]:
-    # Explicitly use Callback API v1 to avoid deprecation warning on paho-mqtt 2.x
-    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, client_id=CLIENT_ID, clean_session=True)
-
-    if MQTT_USER and MQTT_PASS:
-        client.username_pw_set(MQTT_USER, MQTT_PASS)
-
-    # Last Will: offline
-    client.will_set(MQTT_STATUS, "offline", qos=QOS, retain=True)
-
-    try:
-        client.connect(MQTT_BROKER, MQTT_PORT, keepalive=60)
-        client.loop_start()
-        log.info(f"[MQTT] Connected to {MQTT_BROKER}:{MQTT_PORT}")
-        # Birth: online
-        client.publish(MQTT_STATUS, "online", qos=QOS, retain=True)
-        return client
-    except Exception as e:
-        log.error(f"[MQTT] Connection failed: {e}")
+    tokens = _TOKEN_RE.finditer(raw)
+    next(tokens)  # "pm" header
+    values: List[Any] = []
+    append = values.append
+    for m in tokens:
+        kind = m.lastindex
+        if kind == 1:
+            append(float(m.group(1)))
+        elif kind == 2:
+            append(int(m.group(2)))
+        else:
+            append(None)
+    return values or None
+
+# Optional Cython build of the parser above (cythonize -i _fastparse.pyx)
+try:
+    from _fastparse import parse_pm_line  # noqa: F811
+    FAST_PARSER = True
+except ImportError:
+    FAST_PARSER = False
+
+# ------------------ Discovery (einmalig beim Import vorberechnet) ------------------
+def _encode_json(obj: Any) -> bytes:
+    if HAS_ORJSON:
+        return orjson.dumps(obj)  # compact UTF-8 bytes, same output as below
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+def _build_discovery_payloads() -> Dict[int, Tuple[str, bytes]]:
+    # Only used here: device_class ends up baked into the cached payloads
+    def device_class(name: str, unit: str) -> Optional[str]:
+        if unit == "°C":
+            return "temperature"
+        elif unit == "%":
+            return "humidity" if ("Feuchte" in name or "Luftfeuchte" in name) else None
+        elif unit == "bar":
+            return "pressure"
+        elif "Leistung" in name:
+            return "power"
         return None
 
-def send_discovery(mqtt_client: mqtt.Client):
     device = {
         "identifiers": ["nano_pk"],
         "manufacturer": "ETA",
@@ -114,6 +130,8 @@ def send_discovery(mqtt_client: mqtt.Client):
         "payload_not_available": "offline"
     }]
 
+    payloads: Dict[int, Tuple[str, bytes]] = {}
+
     # Sensors
     for idx, entry in channel_map.items():
         mqtt_name = entry.get("mqtt_name", entry["alias"])
@@ -135,16 +153,14 @@ def send_discovery(mqtt_client: mqtt.Client):
         if idx != 0:
             payload["unit_of_measurement"] = unit
             payload["state_class"] = "measurement"
-            dc = get_device_class(label, unit)
+            dc = device_class(label, unit)
             if dc:
                 payload["device_class"] = dc
 
-        mqtt_client.publish(config_topic, json.dumps(payload), qos=QOS, retain=True)
-        log.info(f"[MQTT] Discovery sent: {label}")
+        payloads[idx] = (config_topic, _encode_json(payload))
 
-    # Connectivity binary sensor (still useful)
-    config_topic = "homeassistant/binary_sensor/nano_pk_status/config"
-    payload = {
+    # Connectivity binary sensor (still useful), key -1 as it has no channel
+    payloads[-1] = ("homeassistant/binary_sensor/nano_pk_status/config", _encode_json({
         "name": "NanoPK Status",
         "state_topic": MQTT_STATUS,
         "payload_on": "online",
@@ -153,19 +169,116 @@ def send_discovery(mqtt_client: mqtt.Client):
         "unique_id": "nano_pk_status",
         "device": device,
         "availability": availability,
-    }
-    mqtt_client.publish(config_topic, json.dumps(payload), qos=QOS, retain=True)
-    log.info("[MQTT] Discovery for connectivity sensor sent")
+    }))
+    return payloads
+
+# idx -> (config_topic, serialized payload); reused on every (re)send
+DISCOVERY_PAYLOADS = _build_discovery_payloads()
+
+# ------------------ Kanal-Tabelle (dicht, per idx) ------------------
+def _build_channels() -> List[Optional[Tuple[str, bool, bool]]]:
+    # paho only accepts str topics (it encodes them itself), so keep them as str
+    channels: List[Optional[Tuple[str, bool, bool]]] = [None] * (max(channel_map) + 1)
+    for idx, entry in channel_map.items():
+        mqtt_name = entry.get("mqtt_name", entry["alias"])
+        # Measurements (anything with a unit) always go out with FLOAT_DECIMALS,
+        # whether the nanoPK printed "61" or "60.9". Unitless channels are
+        # states/codes/counters and keep the token's own int/float form.
+        fixed = bool(entry.get("unit"))
+        channels[idx] = (f"{MQTT_BASE}/{mqtt_name}", idx == 0, fixed)
+    return channels
+
+# idx -> (state_topic, is_status, fixed_decimals) or None for unmapped indices
+CHANNELS = _build_channels()
+
+_MISSING = object()  # "nothing published yet" marker in Bridge.last_values
+
+# ------------------ MQTT ------------------
+def on_socket_open(client: mqtt.Client, userdata: Any, sock: Any):
+    # No Nagle delay for small publishes, bigger send buffer for bursts
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 20)
+    except (OSError, AttributeError) as e:
+        log.warning(f"[MQTT] Socket tuning failed: {e}")
+
+def on_connect(client: mqtt.Client, userdata: Any, flags: Any, reason_code: Any, properties: Any):
+    # Also runs after paho's automatic reconnects, so the birth message is re-sent
+    if reason_code.is_failure:
+        log.error(f"[MQTT] Connection refused: {reason_code}")
+        return
+    log.info(f"[MQTT] Connected to {MQTT_BROKER}:{MQTT_PORT}")
+    # Birth: online
+    client.publish(MQTT_STATUS, B_ONLINE, qos=QOS, retain=True)
+    # Telemetry isn't retained and dedup skips unchanged values, so have the
+    # publisher send every channel again with the next pm line.
+    userdata.resync.set()
+    # clean_session=True drops subscriptions, so renew on every connect
+    client.subscribe(HA_STATUS, qos=QOS)
+
+def on_message(client: mqtt.Client, userdata: Any, msg: mqtt.MQTTMessage):
+    # Home Assistant restarted: it has lost all non-retained states
+    if msg.topic == HA_STATUS and msg.payload == B_ONLINE:
+        log.info("[MQTT] Home Assistant online – resending discovery + all values")
+        send_discovery(client)
+        userdata.resync.set()
+
+def on_disconnect(client: mqtt.Client, userdata: Any, flags: Any, reason_code: Any, properties: Any):
+    if reason_code != 0:
+        log.warning(f"[MQTT] Connection lost ({reason_code}) – paho reconnects …")
+
+def mqtt_connect(bridge: "Bridge") -> Optional[mqtt.Client]:
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=CLIENT_ID, clean_session=True, userdata=bridge)
+    client.on_socket_open = on_socket_open
+    client.on_connect = on_connect
+    client.on_disconnect = on_disconnect
+    client.on_message = on_message
+    # Wider window so QoS 1 publishes don't stall on a single outstanding PUBACK
+    client.max_inflight_messages_set(100)
+    client.max_queued_messages_set(10000)
+    # Backoff for paho's own reconnects once the loop is running
+    client.reconnect_delay_set(min_delay=1, max_delay=30)
+
+    if MQTT_USER and MQTT_PASS:
+        client.username_pw_set(MQTT_USER, MQTT_PASS)
+
+    # Last Will: offline
+    client.will_set(MQTT_STATUS, B_OFFLINE, qos=QOS, retain=True)
+
+    # Initial connect: retry with backoff + jitter instead of giving up.
+    # Returns None if a stop signal arrives while waiting.
+    delay = 1
+    while bridge.running:
+        try:
+            log.info(f"[MQTT] Connecting to {MQTT_BROKER}:{MQTT_PORT} …")
+            client.connect(MQTT_BROKER, MQTT_PORT, keepalive=60)
+            client.loop_start()
+            return client
+        except Exception as e:
+            wait = delay * random.uniform(0.5, 1.5)
+            log.warning(f"[MQTT] Connection failed: {e} – retry in {wait:.1f}s …")
+            # Wakes up early when Bridge.stop() sets the event
+            bridge.stopping.wait(wait)
+            delay = min(delay * 2, 30)
+    return None
+
+def send_discovery(mqtt_client: mqtt.Client):
+    for topic, payload in DISCOVERY_PAYLOADS.values():
+        mqtt_client.publish(topic, payload, qos=QOS, retain=True)
+    log.info(f"[MQTT] Discovery sent ({len(DISCOVERY_PAYLOADS)} configs)")
 
 # ------------------ Telnet ------------------
-def connect_telnet_with_backoff() -> telnetlib.Telnet:
+def connect_telnet_with_backoff() -> socket.socket:
+    # The nanoPK just streams newline-separated ASCII, a plain TCP socket is enough
     delay = 1
     while True:
         try:
             log.info(f"[Telnet] Connecting to {HOST}:{PORT} …")
-            tn = telnetlib.Telnet(HOST, PORT, timeout=10)
+            sock = socket.create_connection((HOST, PORT), timeout=10)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.settimeout(5)  # idle wait per recv()
             log.info("[Telnet] Connected.")
-            return tn
+            return sock
         except Exception as e:
             log.warning(f"[Telnet] {e} – retry in {delay}s …")
             time.sleep(delay)
@@ -175,95 +288,176 @@ def connect_telnet_with_backoff() -> telnetlib.Telnet:
 class Bridge:
     def __init__(self):
         self.mqtt: Optional[mqtt.Client] = None
-        self.tn: Optional[telnetlib.Telnet] = None
-        self.last_values: Dict[int, Any] = {}
+        self.sock: Optional[socket.socket] = None
+        # dense per-idx last published payload, _MISSING until first publish
+        self.last_values: List[Any] = [_MISSING] * len(CHANNELS)
+        self._rx_buf = b""
+        self._last_raw = b""
+        # parsed pm lines (reader -> publisher thread), None stops the publisher
+        self._tx: queue.SimpleQueue = queue.SimpleQueue()
+        self._publisher: Optional[threading.Thread] = None
+        # set by on_connect: publisher forgets last_values and republishes all
+        self.resync = threading.Event()
         self.running = True
+        self.stopping = threading.Event()
 
     def start(self):
         signal.signal(signal.SIGINT, self.stop)
         signal.signal(signal.SIGTERM, self.stop)
 
-        self.mqtt = mqtt_connect()
+        self.mqtt = mqtt_connect(self)
         if not self.mqtt:
-            log.error("MQTT unavailable – exiting.")
-            sys.exit(1)
+            self.cleanup()
+            return
 
         send_discovery(self.mqtt)
-        self.tn = connect_telnet_with_backoff()
+        self._publisher = threading.Thread(target=self.publisher_loop, name="mqtt-publisher", daemon=True)
+        self._publisher.start()
+        self.sock = connect_telnet_with_backoff()
 
         while self.running:
             try:
-                raw = self.tn.read_until(b"\n", timeout=5)
-                if not raw:
-                    continue
-
-                line = raw.decode("utf-8", errors="ignore").strip()
-                if not line:
-                    continue
-
-                values = parse_pm_line(line)
-                if not values:
-                    continue
-
-                for idx, val in enumerate(values):
-                    if idx not in channel_map or val is None:
-                        continue
-
-                    entry = channel_map[idx]
-                    mqtt_name = entry.get("mqtt_name", entry["alias"])
-                    topic = f"{MQTT_BASE}/{mqtt_name}"
-
-                    if idx == 0:
-                        payload: Any = ZK_STATUS_MAP.get(val, ZK_STATUS_MAP[0])
-                    else:
-                        payload = val
-
-                    last = self.last_values.get(idx)
-                    if last is not None and almost_equal(last, payload):
-                        continue
-
-                    # NEW: retain can be switched via MQTT_RETAIN env var
-                    self.mqtt.publish(topic, payload, qos=QOS, retain=MQTT_RETAIN)
-                    self.last_values[idx] = payload
-
+                for raw in self.read_lines():
+                    self.handle_line(raw)
             except Exception as e:
                 log.error(f"[Loop] {e} – reconnecting telnet …")
                 try:
-                    if self.tn:
-                        self.tn.close()
+                    if self.sock:
+                        self.sock.close()
                 except Exception:
                     pass
 
                 # Publish offline while reconnecting
                 try:
-                    self.mqtt.publish(MQTT_STATUS, "offline", qos=QOS, retain=True)
+                    self.mqtt.publish(MQTT_STATUS, B_OFFLINE, qos=QOS, retain=True)
                 except Exception:
                     pass
 
                 time.sleep(2)
-                self.tn = connect_telnet_with_backoff()
+                self._rx_buf = b""
+                self.sock = connect_telnet_with_backoff()
 
                 try:
-                    self.mqtt.publish(MQTT_STATUS, "online", qos=QOS, retain=True)
+                    self.mqtt.publish(MQTT_STATUS, B_ONLINE, qos=QOS, retain=True)
                 except Exception:
                     pass
 
         self.cleanup()
 
+    def read_lines(self) -> List[bytes]:
+        # One recv() returns whatever has arrived (up to 64 KiB), so a burst is
+        # handled in one pass. Incomplete tails stay in _rx_buf.
+        try:
+            chunk = self.sock.recv(RECV_BUFSIZE)
+        except socket.timeout:
+            return []  # idle, nothing within 5s
+        if not chunk:
+            raise ConnectionError("connection closed by nanoPK")
+        *lines, self._rx_buf = (self._rx_buf + chunk).split(b"\n")
+        return lines
+
+    def handle_line(self, raw: bytes):
+        # Steady state repeats whole lines; an identical line can't change any
+        # channel, so skip parsing and dedup for it. Plain bytes compare, no hash
+        # collisions possible. A pending resync must still see the line.
+        if raw == self._last_raw and not self.resync.is_set():
+            return
+        self._last_raw = raw
+
+        values = parse_pm_line(raw)
+        if values:
+            self._tx.put(values)
+
+    def publisher_loop(self):
+        # Runs on its own thread: dedup + publish, so a paho stall never blocks
+        # the telnet reader. last_values is only touched here, no lock needed.
+        tx = self._tx
+        while True:
+            lines = [tx.get()]
+            # Drain what piled up meanwhile and publish it in one pass
+            while len(lines) < TX_DRAIN_MAX and not tx.empty():
+                lines.append(tx.get_nowait())
+
+            stop = None in lines
+            if stop:
+                lines = lines[:lines.index(None)]
+
+            # Any error only costs this batch; the thread must survive, or the
+            # reader would keep filling the queue with nobody draining it.
+            try:
+                if self.resync.is_set():
+                    self.resync.clear()
+                    self.last_values[:] = [_MISSING] * len(CHANNELS)
+
+                batch: List[Tuple[int, str, bytes]] = []
+                for values in lines:
+                    self.collect_changes(values, batch)
+
+                if batch:
+                    self.publish_batch(batch)
+            except Exception as e:
+                log.error(f"[Publisher] {e}")
+                # last_values may already hold values that never went out
+                self.resync.set()
+            if stop:
+                return
+
+    def collect_changes(self, values: List[Any], batch: List[Tuple[int, str, bytes]]):
+        last_values = self.last_values
+        float_fmt = _FLOAT_FMT
+        # zip() stops at whichever is shorter, so no explicit bounds check needed
+        for idx, (val, meta) in enumerate(zip(values, CHANNELS)):
+            if meta is None or val is None:
+                continue
+            topic, is_status, fixed = meta
+
+            # Encode once here: paho gets bytes and dedup is a plain bytes compare
+            if is_status:
+                payload = ZK_STATUS_MAP.get(val, ZK_STATUS_MAP[0])
+            elif fixed or type(val) is float:
+                payload = float_fmt % val
+            else:
+                payload = b"%d" % val
+
+            # _MISSING never equals bytes, so the first value always goes out
+            if last_values[idx] == payload:
+                continue
+
+            batch.append((idx, topic, payload))
+            last_values[idx] = payload
+
+    def publish_batch(self, batch: List[Tuple[int, str, bytes]]):
+        # paho's network thread (loop_start) picks up the queued packets and
+        # writes them out together, so keep the enqueue loop as tight as possible.
+        publish = self.mqtt.publish
+        last_values = self.last_values
+        for idx, topic, payload in batch:
+            info = publish(topic, payload, qos=TELEMETRY_QOS, retain=MQTT_RETAIN)
+            if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                # Not sent (QoS 0 while disconnected is dropped, not queued) -
+                # forget the value so the next pm line publishes it again.
+                last_values[idx] = _MISSING
+
     def stop(self, *_):
         log.info("Stop signal received, shutting down …")
         self.running = False
+        self.stopping.set()
 
     def cleanup(self):
+        # Let the publisher flush what is still queued before going offline
+        if self._publisher:
+            self._tx.put(None)
+            self._publisher.join(timeout=5)
+
         try:
             if self.mqtt:
-                self.mqtt.publish(MQTT_STATUS, "offline", qos=QOS, retain=True)
+                self.mqtt.publish(MQTT_STATUS, B_OFFLINE, qos=QOS, retain=True)
         except Exception:
             pass
 
         try:
-            if self.tn:
-                self.tn.close()
+            if self.sock:
+                self.sock.close()
         except Exception:
             pass
 
@@ -277,7 +471,7 @@ class Bridge:
         log.info("Cleanup done. Bye.")
 
 def main():
-    log.info(f"Starting ETA nanoPK MQTT Bridge v{__version__} (retain={MQTT_RETAIN})")
+    log.info(f"Starting ETA nanoPK MQTT Bridge v{__version__} (retain={MQTT_RETAIN}, fast_parser={FAST_PARSER})")
     Bridge().start()
 
 if __name__ == "__main__":